@@ -0,0 +1,493 @@
+import streamlit as st
+import asyncio
+import gzip
+import hashlib
+import queue
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+import httpx
+import orjson
+from transformers import AutoTokenizer
+
+
+# --- App Configuration ---
+@dataclass
+class ChatConfig:
+    """Settings for one chatbot app; everything else is shared by run_chat."""
+    model_id: str
+    title: str
+    page_title: str
+    page_icon: str = "✨"
+    logo_url: str | None = None
+    placeholder: str = "Ask me anything..."
+    # Generation parameters sent with every request
+    parameters: dict = field(default_factory=dict)
+    # Only the most recent user/assistant turns are sent, so the prompt size stays bounded in long chats.
+    max_turns: int = 12
+    # Chat history is stored here so a page reload resumes the conversation.
+    db_path: str = "chat.db"
+    # Static part of every request; only "inputs" changes between turns
+    base_payload: dict = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.base_payload = {
+            "parameters": self.parameters,
+            "stream": True,
+            "options": {
+                "wait_for_model": True
+            }
+        }
+
+    @property
+    def api_url(self):
+        return f"https://api-inference.huggingface.co/models/{self.model_id}"
+
+
+@dataclass
+class ChatState:
+    """One app's chat within a browser session."""
+    session_id: str
+    messages: list
+    # One rendered user/assistant pair per finished turn, see build_prompt
+    rendered_turns: list = field(default_factory=list)
+    # Chained digest after each finished message, see history_digest
+    digests: list = field(default_factory=list)
+
+
+# --- Load the tokenizer once using Streamlit's cache ---
+# This is lightweight and doesn't require torch or a GPU.
+@st.cache_resource
+def load_tokenizer(model_id):
+    """Loads the tokenizer from Hugging Face."""
+    return AutoTokenizer.from_pretrained(model_id)
+
+def try_load_tokenizer(model_id):
+    """
+    Warms the tokenizer cache. A failure isn't cached, so the next load_tokenizer call retries;
+    a call made while this load is running waits for it on the cache_resource lock.
+    """
+    try:
+        load_tokenizer(model_id)
+    except Exception:
+        pass
+
+# It starts loading in a background thread so the page renders without waiting for the download.
+@st.cache_resource
+def preload_tokenizer(model_id):
+    """Starts loading the tokenizer in a background thread, once per process."""
+    threading.Thread(target=try_load_tokenizer, args=(model_id,), daemon=True).start()
+
+
+# --- Read the API token once per process ---
+@st.cache_resource
+def get_auth_headers():
+    """Builds the Authorization header from the Hugging Face token in Streamlit secrets."""
+    return {"Authorization": f"Bearer {st.secrets['HF_TOKEN']}"}
+
+
+# --- Run network I/O on a persistent event loop in a background thread ---
+@st.cache_resource
+def get_event_loop():
+    """Starts an asyncio event loop that lives for the whole Streamlit process."""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+# --- Reuse one HTTP/2 client so concurrent chats share a kept-alive TLS connection ---
+@st.cache_resource
+def get_client():
+    """Creates a pooled async HTTP/2 client for the Hugging Face Inference API."""
+    return httpx.AsyncClient(
+        headers={**get_auth_headers(), "Accept": "text/event-stream", "Accept-Encoding": "gzip"},
+        timeout=httpx.Timeout(180.0, connect=5.0),
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=8, max_connections=32),
+            retries=2
+        )
+    )
+
+# --- Open the pooled connection once at startup so the first message skips the TLS handshake ---
+async def send_head(client, api_url):
+    """Sends a cheap HEAD request, ignoring any failure; it only exists to open the connection."""
+    try:
+        await client.head(api_url, timeout=5)
+    except Exception:
+        pass
+
+@st.cache_resource
+def warm_connection(api_url):
+    """Starts opening the connection on the background loop; the page doesn't wait for it."""
+    asyncio.run_coroutine_threadsafe(send_head(get_client(), api_url), get_event_loop())
+
+
+# --- Helper Functions to Call the API ---
+# A backup request is sent if the first one hasn't streamed a token after this many seconds.
+HEDGE_DELAY = 2.0
+# Only hedge chats with fewer finished turns than this: a cold model is most likely there,
+# and a duplicate of a short prompt is cheap.
+HEDGE_MAX_TURNS = 2
+# Request bodies at least this large are gzip-compressed; smaller ones aren't worth the CPU.
+GZIP_MIN_BYTES = 1024
+# Matches the "text" inside the frame's "token" object when it has no escape sequences, which covers most tokens.
+TOKEN_TEXT_RE = re.compile(rb'"token"\s*:\s*\{[^{}]*?"text"\s*:\s*"([^"\\]*)"')
+
+def encode_payload(payload):
+    """Serializes the request payload, gzip-compressing it once it is large enough to benefit."""
+    body = orjson.dumps(payload)
+    headers = {"Content-Type": "application/json"}
+    if len(body) >= GZIP_MIN_BYTES:
+        body = gzip.compress(body, compresslevel=1)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+async def iter_byte_lines(response):
+    """Splits the streamed response body into lines without decoding it."""
+    # Partial lines stay in one growing bytearray instead of being re-joined with every chunk.
+    buffer = bytearray()
+    async for chunk in response.aiter_bytes():
+        buffer += chunk
+        while (newline := buffer.find(b"\n")) != -1:
+            line = bytes(buffer[:newline])
+            del buffer[:newline + 1]
+            yield line
+    if buffer:
+        yield bytes(buffer)
+
+
+def token_text(line):
+    """Returns the token text carried by an SSE line, or None if the line has no token."""
+    # Check the SSE prefix on the raw bytes; orjson.loads takes bytes, so nothing is decoded here.
+    if not line.startswith(b'data:'):
+        return None
+    event = line[5:].strip()
+    # Skip the end-of-stream sentinel and empty heartbeat frames
+    if event in (b'[DONE]', b''):
+        return None
+    match = TOKEN_TEXT_RE.search(event)
+    if match:
+        return match.group(1).decode('utf-8')
+    try:
+        data = orjson.loads(event)
+    except orjson.JSONDecodeError:
+        # A single malformed keep-alive frame shouldn't end the whole response
+        return None
+    return data.get("token", {}).get("text", "")
+
+
+async def open_stream(client, api_url, body, headers):
+    """
+    Sends the request and waits for the first token.
+    Returns the open response, its remaining lines and the first token (None if the stream ended without one).
+    """
+    request = client.build_request("POST", api_url, content=body, headers=headers)
+    response = await client.send(request, stream=True)
+    try:
+        response.raise_for_status()
+        lines = iter_byte_lines(response)
+        async for line in lines:
+            if (text := token_text(line)) is not None:
+                return response, lines, text
+        return response, lines, None
+    except BaseException:
+        await response.aclose()
+        raise
+
+
+async def open_hedged_stream(client, api_url, body, headers, hedge):
+    """
+    Opens the stream; with `hedge`, sends a second identical request if the first has no token
+    after HEDGE_DELAY seconds, and keeps whichever starts streaming first.
+    """
+    attempts = [asyncio.create_task(open_stream(client, api_url, body, headers))]
+    winner = None
+    try:
+        if hedge:
+            done, _ = await asyncio.wait(attempts, timeout=HEDGE_DELAY)
+            if not done:
+                attempts.append(asyncio.create_task(open_stream(client, api_url, body, headers)))
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = task
+                    return task.result()
+        # Every attempt failed, so report the first request's error
+        return attempts[0].result()
+    finally:
+        # Cancel the slower request, or close it if both finished together
+        for task in attempts:
+            if task is winner:
+                continue
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is None:
+                await task.result()[0].aclose()
+
+
+async def stream_tokens(client, api_url, body, headers, hedge=False):
+    """
+    Streams the generated tokens from the API as they arrive.
+    Connection and HTTP errors propagate, so the caller can tell a failed answer from a real one.
+    """
+    response, lines, text = await open_hedged_stream(client, api_url, body, headers, hedge)
+    try:
+        if text is not None:
+            yield text
+        async for line in lines:
+            if (text := token_text(line)) is not None:
+                yield text
+    finally:
+        await response.aclose()
+
+
+# Put on the token queue once the stream is finished
+STREAM_END = object()
+
+async def pump_tokens(tokens, token_queue):
+    """Moves tokens from an async stream onto a queue read by the script thread."""
+    try:
+        async for token in tokens:
+            token_queue.put(token)
+    finally:
+        token_queue.put(STREAM_END)
+
+
+# --- THE CORRECT WAY TO FORMAT THE PROMPT ---
+# Use the tokenizer to apply the chat template. This is the official and robust method.
+# Finished turns are rendered once and kept in the session, so each message only renders the new turn.
+@st.cache_resource
+def get_generation_suffix(model_id):
+    """Returns the text the chat template appends when add_generation_prompt=True."""
+    tokenizer = load_tokenizer(model_id)
+    sample = [{"role": "user", "content": "x"}]
+    with_prompt = tokenizer.apply_chat_template(sample, tokenize=False, add_generation_prompt=True)
+    without_prompt = tokenizer.apply_chat_template(sample, tokenize=False, add_generation_prompt=False)
+    return with_prompt[len(without_prompt):]
+
+def render_messages(tokenizer, messages):
+    """Renders messages with the chat template, without the leading BOS token."""
+    rendered = tokenizer.apply_chat_template(messages, tokenize=False)
+    return rendered.removeprefix(tokenizer.bos_token or "")
+
+def build_prompt(config, chat):
+    """
+    Builds the prompt for the last `max_turns` turns of the history, rendering only the turns added since the last call.
+    """
+    tokenizer = load_tokenizer(config.model_id)
+    # One entry per finished user/assistant pair; the history always ends with the new user message.
+    messages, rendered_turns = chat.messages, chat.rendered_turns
+    for start in range(2 * len(rendered_turns), len(messages) - 1, 2):
+        rendered_turns.append(render_messages(tokenizer, messages[start:start + 2]))
+    return (
+        (tokenizer.bos_token or "")
+        + "".join(rendered_turns[-config.max_turns:])
+        + render_messages(tokenizer, messages[-1:])
+        + get_generation_suffix(config.model_id)
+    )
+
+
+def get_response(config, chat):
+    """
+    Formats the chat history using the official tokenizer and sends it to the API.
+    """
+    payload = {**config.base_payload, "inputs": build_prompt(config, chat)}
+
+    # The request runs on the background loop and hands tokens over through a queue,
+    # because st.write_stream needs a regular generator.
+    token_queue = queue.Queue()
+    # The history ends with the new user message, so this counts the finished turns before it
+    hedge = len(chat.messages) // 2 < HEDGE_MAX_TURNS
+    body, headers = encode_payload(payload)
+    tokens = stream_tokens(get_client(), config.api_url, body, headers, hedge)
+    future = asyncio.run_coroutine_threadsafe(pump_tokens(tokens, token_queue), get_event_loop())
+    try:
+        while (token := token_queue.get()) is not STREAM_END:
+            yield token
+        # Re-raises any error from the request here in the script thread
+        future.result()
+    finally:
+        # Stops the request if the script is interrupted mid-stream; a no-op once it has finished
+        future.cancel()
+
+
+def coalesce_tokens(tokens, interval=0.05):
+    """
+    Groups streamed tokens into chunks of about `interval` seconds, so the chat bubble re-renders less often.
+    """
+    buffer = []
+    last_flush = time.monotonic()
+    for token in tokens:
+        buffer.append(token)
+        if time.monotonic() - last_flush >= interval:
+            yield "".join(buffer)
+            buffer.clear()
+            last_flush = time.monotonic()
+    if buffer:
+        yield "".join(buffer)
+
+
+# --- Persist chat history in SQLite ---
+@st.cache_resource
+def get_db(db_path):
+    """Opens the SQLite database shared by all chat sessions."""
+    con = sqlite3.connect(db_path, check_same_thread=False)
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS msgs("
+        "model TEXT, sid TEXT, ord INT, role TEXT, content TEXT, PRIMARY KEY (model, sid, ord))"
+    )
+    con.commit()
+    return con
+
+@st.cache_resource
+def get_db_lock(db_path):
+    """Serializes access to the shared connection across Streamlit sessions."""
+    return threading.Lock()
+
+def get_session_id():
+    """Returns the chat's id, kept in the URL so reloading the page resumes the same chat."""
+    sid = st.query_params.get("sid")
+    if not sid:
+        sid = uuid.uuid4().hex
+        st.query_params["sid"] = sid
+    return sid
+
+def get_chat_state(config):
+    """Returns this app's chat, keyed by model so apps sharing a browser session keep separate chats."""
+    key = f"chat:{config.model_id}"
+    if key not in st.session_state:
+        # Resume the stored history for this chat, or start with an empty one
+        sid = get_session_id()
+        st.session_state[key] = ChatState(session_id=sid, messages=load_messages(config, sid))
+    return st.session_state[key]
+
+def load_messages(config, sid):
+    """Loads the stored history of a chat in order."""
+    with get_db_lock(config.db_path):
+        rows = get_db(config.db_path).execute(
+            "SELECT role, content FROM msgs WHERE model = ? AND sid = ? ORDER BY ord", (config.model_id, sid)
+        ).fetchall()
+    return [{"role": role, "content": content} for role, content in rows]
+
+def save_messages(config, sid, messages):
+    """Appends messages to the stored history of a chat."""
+    con = get_db(config.db_path)
+    with get_db_lock(config.db_path), con:
+        # Number from the stored history, not this tab's copy, so tabs sharing a sid can't reuse an ord
+        (next_ord,) = con.execute(
+            "SELECT COALESCE(MAX(ord), -1) + 1 FROM msgs WHERE model = ? AND sid = ?", (config.model_id, sid)
+        ).fetchone()
+        con.executemany(
+            "INSERT INTO msgs VALUES (?, ?, ?, ?, ?)",
+            [(config.model_id, sid, next_ord + i, m["role"], m["content"]) for i, m in enumerate(messages)]
+        )
+
+
+# --- Chat Interface Logic ---
+ROLE_LABELS = {"user": "**You**", "assistant": "**Assistant**"}
+
+def history_digest(chat, count):
+    """
+    Returns a digest of the first `count` messages, chained so each message is only hashed once.
+    Only finished turns are digested, and those never change afterwards.
+    """
+    digests = chat.digests
+    while len(digests) < count:
+        previous = digests[-1] if digests else b""
+        digests.append(hashlib.sha1(previous + orjson.dumps(chat.messages[len(digests)])).digest())
+    return digests[count - 1].hex()
+
+# A CommonMark code fence: at most 3 spaces of indent, then a run of 3+ backticks or tildes.
+FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})(.*)$")
+
+def close_code_fences(text):
+    """Closes a code fence left open by a cut-off answer, so it can't swallow the messages after it."""
+    fence = None
+    for line in text.splitlines():
+        match = FENCE_RE.match(line)
+        if not match:
+            continue
+        run, rest = match.groups()
+        if fence is None:
+            # A backtick fence's info string can't contain backticks
+            if not (run[0] == "`" and "`" in rest):
+                fence = run
+        elif run[0] == fence[0] and len(run) >= len(fence) and not rest.strip():
+            fence = None
+    return text if fence is None else f"{text}\n{fence}"
+
+@st.cache_data(max_entries=256)
+def history_markdown(digest, count, _messages):
+    """
+    Joins the first `count` messages of a chat into a single markdown block.
+    The cache is shared by every session, so it is keyed on a digest of the content rather than the chat id.
+    """
+    return "\n\n---\n\n".join(
+        f"{ROLE_LABELS.get(m['role'], m['role'])}\n\n{close_code_fences(m['content'])}" for m in _messages[:count]
+    )
+
+def run_chat(config):
+    """
+    Renders the chat page for `config` and answers new messages.
+    """
+    st.set_page_config(page_title=config.page_title, page_icon=config.page_icon)
+
+    if config.logo_url:
+        st.image(config.logo_url, width=200)
+    st.title(config.title)
+
+    preload_tokenizer(config.model_id)
+
+    try:
+        get_auth_headers()
+    except (FileNotFoundError, KeyError):
+        st.error("Hugging Face API token not found. Please add it to your Streamlit secrets.", icon="🔑")
+        st.stop()
+
+    warm_connection(config.api_url)
+
+    chat = get_chat_state(config)
+
+    # Display previous messages: earlier turns as one cached block, the latest turn as chat bubbles
+    messages = chat.messages
+    earlier = max(len(messages) - 2, 0)
+    with st.container():
+        if earlier:
+            st.markdown(history_markdown(history_digest(chat, earlier), earlier, messages))
+    for message in messages[earlier:]:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
+
+    # Get new user input
+    if prompt := st.chat_input(config.placeholder):
+        # Add user message to history and display it
+        chat.messages.append({"role": "user", "content": prompt})
+        with st.chat_message("user"):
+            st.markdown(prompt)
+
+        # Get and display assistant's response
+        with st.chat_message("assistant"):
+            response_stream = get_response(config, chat)
+            # Whatever stops the answer (an API error, any other exception, or a rerun interrupting it),
+            # the unanswered message is dropped so the history always ends on a finished pair.
+            try:
+                full_response = st.write_stream(coalesce_tokens(response_stream))
+            except httpx.HTTPError as e:
+                chat.messages.pop()
+                st.error(f"Could not connect to the API. {e}")
+                return
+            except BaseException:
+                chat.messages.pop()
+                raise
+
+        # Add the full response to the history
+        chat.messages.append({"role": "assistant", "content": full_response})
+
+        # Store the finished turn as a pair, so a reload never resumes on an unanswered message
+        save_messages(config, chat.session_id, chat.messages[-2:])